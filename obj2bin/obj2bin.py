@@ -1,11 +1,22 @@
 from __future__ import annotations
 
-from functools import reduce
+import re
+import sys
+import struct
+import ast
+import builtins
+import linecache
+from copy import deepcopy
+from string import Formatter
+from types import CodeType, LambdaType
+from inspect import CO_VARARGS, CO_VARKEYWORDS, Parameter, signature
+from itertools import starmap, takewhile
+from functools import reduce, lru_cache
 from contextlib import suppress
 from dataclasses import dataclass
 from platform import python_version_tuple
-from typing import TypeVar, Callable, Iterable, Any
-from struct import pack_into, unpack_from, calcsize as calcsize_fmt
+from typing import TypeVar, Callable, Collection, Iterable, Any
+from struct import Struct, pack_into, unpack_from, calcsize as calcsize_fmt
 
 # TODO: add stop option to Child?
 
@@ -15,17 +26,32 @@ assert tuple(map(int, python_version_tuple()))[0:2] >= (3, 7), "unsupported pyth
 _T = TypeVar("_T")
 _STOP = "stop"
 _PATTRS = "_pattrs"
+_PRUNS = "_pruns"
+_ORDERS = "@=<>!"
+_ENCODE = "_encode"
+_DECODE = "_decode"
+_CALCSIZE = "_calcsize"
+_PACK = "_pack"
+_SCOPED = {"globals", "locals", "vars", "dir", "eval", "exec", "compile", "__import__", "breakpoint"} # builtins whose result depends on the calling scope
+_ENCODE_MANY = "_encode_many"
+_DECODE_MANY = "_decode_many"
+_FIXED_SIZE = "_fixed_size"
+_NATIVE = "<" if sys.byteorder == "little" else ">"
+_INTCODES = "bBhHiIlLqQnNP"
+_FLOATCODES = "efd"
 
 def utf8size(s: str) -> int: return len(s)
 def utf8tobytes(s: str) -> bytes: return bytes(s, "utf-8")
 def utf8frombytes(b: bytes) -> str: return b.decode("utf-8")
 def vargs(fn: Callable[..., Any]) -> Callable[..., Any]: return lambda x: fn(*x)
 def totuple(val: object) -> list | tuple: return tuple(val) if hasattr(val, "__iter__") else (val,)
+def valargs(val: object) -> list | tuple: return val if isinstance(val, (list, tuple)) else (val,)
 def expifsingle(val: list | tuple | object) -> list | tuple | object: return val[0] if isinstance(val, (tuple, list)) and len(val) == 1 else val
 def fnwalk(fn: Callable[..., Any] | Iterable[Callable[..., Any]] | None, *args: tuple) -> object | None:
   return reduce(lambda v, f: f(expifsingle(v)) if callable(f) else v, [args, *fn] if isinstance(fn, (tuple, list)) else [args, fn])
 
 class PackAttribute:
+  __slots__ = ("dec", "enc")
   def __init__(self, enc: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None, dec: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None): self.enc, self.dec = enc, dec
   def process(self, fn: Callable[..., Any] | Iterable[Callable[..., Any]] | None, val: object) -> object:
     if not isinstance(val, (tuple, list)): val = [val]
@@ -34,15 +60,18 @@ class PackAttribute:
   def decode(self, val: object) -> object: return self.process(self.dec, val)
 
 class Field(PackAttribute):
-  def __init__(self, fmt: str, stop: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None,
+  __slots__ = ("fmt", "meta", "stop")
+  def __init__(self, fmt: str, stop: object = None,
                enc: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None, dec: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None, meta: bool = False):
     self.fmt, self.stop, self.enc, self.dec, self.meta = fmt, stop, enc, dec, meta
 
 class Const(PackAttribute):
+  __slots__ = ("fmt", "value")
   def __init__(self, value: object, fmt: str, enc: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None, dec: Callable[..., Any] | Iterable[Callable[..., Any]] | None = None):
     self.value, self.fmt, self.enc, self.dec = value, fmt, enc, dec
 
 class Child:
+  __slots__ = ("childs", "count", "size")
   def __init__(self, *childs: type, size: int | str = 0, count: int | str = 0): self.childs, self.size, self.count = childs, size, count
   def attrs(self, name: str, vals: dict, obj: object | None = None) -> tuple[list, int, int]:
     size = self.size if isinstance(self.size, int) else 0
@@ -53,74 +82,499 @@ class Child:
     if not isinstance(childs, (tuple, list)): childs = [childs]
     return childs, size, count
 
-def pack(**attrs: Const | Field | Child) -> Callable[[type], type]: return lambda x: setattr(x, _PATTRS, attrs) or dataclass(x) # type: ignore[func-returns-value]
-def calcsize(obj: object) -> int:
-  # dictionary holding the processed values passed as a variadic argument to format Fields' format string (in case some Field uses another's value as format string)
-  vals: dict[str, Any] = {}
-  size = 0
-  for name, attr in getattr(obj, _PATTRS).items():
+def _fmtsplit(fmt: str) -> tuple[str, str]: return (fmt[0], fmt[1:]) if fmt[:1] in _ORDERS else ("@", fmt)
+def _fmtvals(fmt: str) -> int: return len(unpack_from(fmt, bytes(calcsize_fmt(fmt))))
+def _isfixed(attr: Const | Field | Child) -> bool: return not isinstance(attr, Child) and getattr(attr, _STOP, None) is None and "{" not in attr.fmt
+def _fusable(order: str, body: str) -> bool:
+  # native alignment may add padding between fused fields, which would not be there when packing them one by one
+  try: return order != "@" or calcsize_fmt(f"@{body}") == calcsize_fmt(f"={body}")
+  except struct.error: return False
+
+def _fmtorder(fmt: str) -> tuple[str, str]:
+  # explicit byte order for native/network order formats whose layout does not depend on it, so that differently written fields may still share a Struct
+  order, body = _fmtsplit(fmt)
+  if order == "!": return ">", body
+  return (_NATIVE, body) if order in "@=" and _fusable(order, body) else (order, body)
+
+def _fuse(attrs: dict[str, Const | Field | Child]) -> list[tuple[Struct | None, tuple[tuple[str, Any, int], ...]]]:
+  # group maximal runs of fixed-size attributes sharing a byte order into a single precompiled Struct (other attributes get a run of their own with no Struct)
+  # meta fields are fused like any other field, except for the back-patched ones whose room is reserved on their own (see _backpatched)
+  patched = {meta for meta, _ in _backpatched(attrs).values()}
+  runs: list[tuple[Struct | None, tuple[tuple[str, Any, int], ...]]] = []
+  order, body = "", ""
+  group: list[tuple[str, Any, int]] = []
+  for name, attr in [*attrs.items(), ("", None)]:
+    fmt = attr.fmt if isinstance(attr, (Const, Field)) and _isfixed(attr) and name not in patched else None
+    if fmt is not None:
+      o, b = _fmtorder(fmt)
+      if group and o == order and _fusable(o, body + b):
+        body, group = body + b, [*group, (name, attr, _fmtvals(fmt))]
+        continue
+    if group: runs.append((Struct(order + body), tuple(group)))
+    order, body, group = "", "", []
+    if fmt is not None: order, body, group = *_fmtorder(fmt), [(name, attr, _fmtvals(fmt))]
+    elif attr is not None: runs.append((None, ((name, attr, 0),)))
+  return runs
+
+# the functions below generate, once per pack class, straight-line source code for its _encode, _decode and _calcsize functions
+# so that no attribute list has to be interpreted on each call (the generated code is exec'd with the namespace built alongside it)
+def _ref(ns: dict[str, Any], val: object) -> str:
+  name = f"_k{len(ns)}"
+  ns[name] = val
+  return name
+
+def _fmtrefs(fmt: str) -> list[str]: return [re.split(r"[.\[]", f)[0] for _, f, _, _ in Formatter().parse(fmt) if f]
+def _fmtargs(fmt: str, avail: list[str]) -> str: return ", ".join(f"{n}=v_{n}" for n in dict.fromkeys(_fmtrefs(fmt)) if n in avail)
+def _childarg(val: int | str, avail: list[str]) -> str:
+  assert isinstance(val, int) or val in avail, f"unknown attribute \"{val}\" used as child size/count"
+  return str(val) if isinstance(val, int) else f"v_{val}"
+
+@lru_cache(maxsize=16)
+def _parsefile(filename: str) -> ast.Module | None:
+  with suppress(SyntaxError, ValueError): return ast.parse("".join(linecache.getlines(filename)))
+  return None
+
+def _samecode(node: ast.Lambda, code: CodeType) -> bool:
+  with suppress(SyntaxError, ValueError, TypeError):
+    lam = next(c for c in compile(ast.Expression(node), code.co_filename, "eval").co_consts if isinstance(c, CodeType))
+    return (lam.co_code, lam.co_consts, lam.co_names) == (code.co_code, code.co_consts, code.co_names)
+  return False
+
+class _Subst(ast.NodeTransformer):
+  def __init__(self, name: str, expr: ast.expr): self.name, self.expr = name, expr
+  def visit_Name(self, node: ast.Name) -> ast.expr: return self.expr if node.id == self.name else node
+
+class _Simplify(ast.NodeTransformer):
+  # drops the conversions which can not change an unpacked value of the given format code (param): int() of an integer, float() of a float
+  # and float() of a true division between numbers (which already is a float)
+  def __init__(self, param: str, code: str): self.param, self.code = param, code
+  def isparam(self, node: ast.expr, codes: str) -> bool: return isinstance(node, ast.Name) and node.id == self.param and self.code in codes
+  def isnumber(self, node: ast.expr) -> bool: return self.isparam(node, _INTCODES + _FLOATCODES) or (isinstance(node, ast.Constant) and type(node.value) in (int, float))
+  def visit_Call(self, node: ast.Call) -> ast.expr:
+    self.generic_visit(node)
+    if not isinstance(node.func, ast.Name) or node.func.id not in ("int", "float") or len(node.args) != 1 or node.keywords: return node
+    arg = node.args[0]
+    if self.isparam(arg, _INTCODES if node.func.id == "int" else _FLOATCODES): return arg
+    if node.func.id == "float" and isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Div) and self.isnumber(arg.left) and self.isnumber(arg.right): return arg
+    return node
+
+def _inline(fn: object, arg: str, fmtcode: str = "") -> str | None:
+  # returns the body of a trivial lambda (single use of its parameter, only builtins as free names) with its parameter replaced by arg, so that the
+  # generated code evaluates it in place instead of paying a python call per value; None if fn can not be inlined (its source is looked up by line and bytecode)
+  # NOTE: the inlined result skips the expifsingle unwrapping of PackAttribute.process, so bodies which are tuple/list displays are never inlined and
+  #       any other body is expected to evaluate to a single value
+  # fmtcode is the struct format code of the value arg evaluates to, if known (see _Simplify)
+  code = getattr(fn, "__code__", None)
+  if not isinstance(fn, LambdaType) or fn.__name__ != "<lambda>" or not isinstance(code, CodeType) or not hasattr(ast, "unparse"): return None
+  if fn.__closure__ or fn.__defaults__ or fn.__kwdefaults__ or code.co_argcount != 1 or code.co_kwonlyargcount or code.co_flags & (CO_VARARGS | CO_VARKEYWORDS): return None
+  tree = _parsefile(code.co_filename)
+  node = next((n for n in ast.walk(tree) if isinstance(n, ast.Lambda) and n.lineno == code.co_firstlineno and _samecode(n, code)), None) if tree is not None else None
+  if node is None or isinstance(node.body, (ast.Tuple, ast.List)) or any(isinstance(n, (ast.Lambda, ast.comprehension, ast.NamedExpr, ast.Await, ast.Yield, ast.YieldFrom)) for n in ast.walk(node.body)): return None
+  param, names = node.args.args[0].arg, [n.id for n in ast.walk(node.body) if isinstance(n, ast.Name)]
+  if names.count(param) != 1 or any(n != param and (n in fn.__globals__ or n in _SCOPED or not hasattr(builtins, n)) for n in names): return None
+  body = _Simplify(param, fmtcode).visit(deepcopy(node.body)) if fmtcode else deepcopy(node.body)
+  return f"({ast.unparse(_Subst(param, ast.parse(arg, mode='eval').body).visit(body))})"
+
+def _encexpr(ns: dict[str, Any], name: str, attr: Const | Field, n: int | None = None) -> str:
+  # n is the number of values the attribute packs (None if the format string is only known at runtime or the attribute is stop delimited)
+  if isinstance(attr, Const): return _ref(ns, attr.encode(attr.value))
+  # values without enc still go through the same unwrapping as PackAttribute.process (a single-element list/tuple packs as its element)
+  if attr.enc is None: return f"expifsingle(obj.{name})" if n == 1 else f"obj.{name}"
+  return (n == 1 and _inline(attr.enc, f"obj.{name}")) or f"{_ref(ns, attr.encode)}(obj.{name})"
+
+def _decexpr(ns: dict[str, Any], attr: Const | Field, tup: str, item: str, n: int | None = None) -> str:
+  # tup evaluates to the attribute's unpacked values and item to its first one (only used when the attribute takes a single value)
+  if attr.dec is None: return f"expifsingle({tup})" if n is None else item if n == 1 else tup
+  return (n == 1 and _inline(attr.dec, item, _fmtsplit(attr.fmt)[1][-1:])) or f"{_ref(ns, attr.decode)}({tup})"
+
+def _packargs(ns: dict[str, Any], items: tuple[tuple[str, Any, int], ...], refs: set, given: Collection[str] = ()) -> tuple[list[str], str]:
+  # arguments packing a fused run (attributes referenced later on are kept in local variables, given ones are already)
+  code: list[str] = []
+  args: list[str] = []
+  for name, attr, n in items:
+    expr = f"v_{name}" if name in given else _encexpr(ns, name, attr, n)
+    if name in refs and name not in given: code, expr = [*code, f"v_{name} = {expr}"], f"v_{name}"
+    args.append(expr if n == 1 else f"*{expr}")
+  return code, ", ".join(args)
+
+def _constraw(attr: Const) -> tuple | None:
+  # the values a Const with dec unpacks to, when dec gives its value back from them (so that matching them spares the dec call)
+  if attr.dec is None: return None
+  with suppress(Exception):
+    fmt = Struct(attr.fmt)
+    raw = fmt.unpack(fmt.pack(*valargs(attr.encode(attr.value))))
+    if attr.decode(raw) == attr.value: return raw
+  return None
+
+def _unpackvals(ns: dict[str, Any], ptype: type, items: tuple[tuple[str, Any, int], ...]) -> list[str]:
+  # assigns the values of a fused run from its unpacked tuple (t), checking Consts along the way
+  code: list[str] = []
+  pos = 0
+  for name, attr, n in items:
+    expr = _decexpr(ns, attr, f"t[{pos}:{pos + n}]", f"t[{pos}]", n)
+    raw = _constraw(attr) if isinstance(attr, Const) else None
+    if raw is not None: expr = f"{_ref(ns, attr.value)} if {f't[{pos}] == {_ref(ns, raw[0])}' if n == 1 else f't[{pos}:{pos + n}] == {_ref(ns, raw)}'} else {expr}"
+    code += [f"v_{name} = {expr}", *_constcheck(ns, ptype, name, attr)]
+    pos += n
+  return code
+
+def _unpackto(ns: dict[str, Any], ptype: type, unpack: str, items: tuple[tuple[str, Any, int], ...]) -> list[str]:
+  # assigns the values of a fused run from the tuple unpack evaluates to, destructuring it straight into the variables when every value is taken as is
+  if all(n == 1 and attr.dec is None for _, attr, n in items):
+    return [f"{', '.join(f'v_{name}' for name, _, _ in items)}, = {unpack}", *(line for name, attr, _ in items for line in _constcheck(ns, ptype, name, attr))]
+  return [*([] if unpack == "t" else [f"t = {unpack}"]), *_unpackvals(ns, ptype, items)]
+
+def _constcheck(ns: dict[str, Any], ptype: type, name: str, attr: Const | Field) -> list[str]:
+  if not isinstance(attr, Const): return []
+  value = _ref(ns, attr.value)
+  return [f"assert v_{name} == {value}, f\"unexpected value found for {ptype.__name__}.{name}: {{v_{name}}} (expected: {{{value}}})\""]
+
+def _backpatched(attrs: dict[str, Const | Field | Child]) -> dict[str, tuple[str, Field]]:
+  # meta fields holding nothing but the size of a later Child (plain single value fixed formats only), by the name of that Child: their value
+  # is the amount of bytes the childs took, so the encoder reserves room for them and writes it once the childs are done instead of reading the meta
+  fmtrefs = {r for attr in attrs.values() if not isinstance(attr, Child) for r in _fmtrefs(attr.fmt)}
+  childrefs = [r for attr in attrs.values() if isinstance(attr, Child) for r in (attr.size, attr.count) if isinstance(r, str)]
+  patched: dict[str, tuple[str, Field]] = {}
+  seen: set[str] = set()
+  for name, attr in attrs.items():
+    seen.add(name)
+    if not isinstance(attr, Child) or not isinstance(attr.size, str) or attr.size not in seen: continue
+    meta = attrs[attr.size]
+    if isinstance(meta, Field) and meta.meta and meta.enc is None and meta.stop is None and "{" not in meta.fmt and _fmtvals(meta.fmt) == 1 \
+       and attr.size not in fmtrefs and childrefs.count(attr.size) == 1: patched[name] = (attr.size, meta)
+  return patched
+
+def _bytesref(attrs: dict[str, Const | Field | Child], attr: Const | Field | Child) -> str | None:
+  # the meta holding the length of a plain "{meta}s" Field (a single integer without dec), whose bytes can then be sliced out of the buffer
+  match = re.fullmatch(r"\{(\w+)\}s", _fmtsplit(attr.fmt)[1]) if isinstance(attr, Field) and attr.stop is None else None
+  meta = attrs.get(match[1]) if match else None
+  if not isinstance(meta, Field) or meta.dec is not None or meta.stop is not None or "{" in meta.fmt: return None
+  return match[1] if match and _fmtvals(meta.fmt) == 1 and _fmtsplit(meta.fmt)[1][-1:] in "bBhHiIlLqQnN" else None
+
+def _stopbyte(attr: Field) -> bytes | None:
+  # the only byte a single byte stop delimited Field decodes to its stop value from, so that the decoder can find it instead of unpacking byte by byte
+  if "{" in attr.fmt or calcsize_fmt(attr.fmt) != 1 or _fmtvals(attr.fmt) != 1: return None
+  unpack, found = Struct(attr.fmt).unpack, []
+  for byte in range(256):
+    with suppress(Exception):
+      if attr.decode(unpack(bytes((byte,)))) == attr.stop: found.append(bytes((byte,)))
+  return found[0] if len(found) == 1 else None
+
+def _countmetas(attrs: dict[str, Const | Field | Child]) -> dict[str, str]:
+  # meta fields (plain single value fixed formats) holding nothing but the count of a later Child, by the name of that Child: their value is
+  # the length of the Child's list, which the encoder loads where the meta is packed instead of reading the meta
+  fmtrefs = {r for attr in attrs.values() if not isinstance(attr, Child) for r in _fmtrefs(attr.fmt)}
+  childrefs = [r for attr in attrs.values() if isinstance(attr, Child) for r in (attr.size, attr.count) if isinstance(r, str)]
+  counted: dict[str, str] = {}
+  seen: set[str] = set()
+  for name, attr in attrs.items():
+    seen.add(name)
+    if not isinstance(attr, Child) or not isinstance(attr.count, str) or attr.count not in seen: continue
+    meta = attrs[attr.count]
+    if isinstance(meta, Field) and meta.meta and meta.enc is None and meta.stop is None and "{" not in meta.fmt and _fmtvals(meta.fmt) == 1 \
+       and attr.count not in fmtrefs and childrefs.count(attr.count) == 1: counted[attr.count] = name
+  return counted
+
+def _lenmetas(attrs: dict[str, Const | Field | Child]) -> dict[str, str]:
+  # meta fields (plain single value fixed formats) only used as the length of a later "{meta}s" Field, by the name of that Field: their value is
+  # the length of the Field's encoded bytes, so the Field is encoded once where the meta is packed instead of reading the meta too
+  fmtrefs = [r for attr in attrs.values() if not isinstance(attr, Child) for r in _fmtrefs(attr.fmt)]
+  childrefs = {r for attr in attrs.values() if isinstance(attr, Child) for r in (attr.size, attr.count)}
+  metas: dict[str, str] = {}
+  seen: set[str] = set()
+  for name, attr in attrs.items():
+    seen.add(name)
+    if not isinstance(attr, Field) or attr.stop is not None or re.fullmatch(r"\{(\w+)\}s", _fmtsplit(attr.fmt)[1]) is None: continue
+    ref, meta = _fmtrefs(attr.fmt)[0], attrs.get(_fmtrefs(attr.fmt)[0])
+    if ref in seen and isinstance(meta, Field) and meta.meta and meta.enc is None and meta.stop is None and "{" not in meta.fmt and _fmtvals(meta.fmt) == 1 \
+       and fmtrefs.count(ref) == 1 and ref not in childrefs: metas[ref] = name
+  return metas
+
+def _constprefix(ptype: type) -> bytes:
+  # the bytes every encoded object of ptype starts with (its leading Consts)
+  prefix = b""
+  for attr in getattr(ptype, _PATTRS, {}).values():
+    if not isinstance(attr, Const) or not _isfixed(attr): break
+    try: prefix += Struct(attr.fmt).pack(*valargs(attr.encode(attr.value)))
+    except struct.error: break
+  return prefix
+
+def _dispatch(childs: tuple[type, ...]) -> dict[bytes, type] | None:
+  # child types by their Const prefix, so that the decoder picks the only type that could decode instead of trying them in turn
+  # (None unless every type has a prefix and none of them starts with another's, which could make the declared order matter)
+  prefixes = [_constprefix(child) for child in childs]
+  if not all(prefixes) or any(a != b and b.startswith(a) for a in prefixes for b in prefixes) or len(set(prefixes)) != len(prefixes): return None
+  return dict(zip(prefixes, childs))
+
+def _ctorargs(attrs: dict[str, Const | Field | Child]) -> str: return ", ".join(f"{name}=v_{name}" for name, attr in attrs.items() if isinstance(attr, Child) or (isinstance(attr, Field) and not attr.meta))
+
+def _childlist(name: str) -> list[str]: return [f"  c_{name} = obj.{name}", f"  if not isinstance(c_{name}, (tuple, list)): c_{name} = [c_{name}]"]
+
+def _genchildencode(ns: dict[str, Any], name: str, attr: Child, avail: list[str], patch: tuple[str, Field] | None, *, counted: bool = False) -> list[str]:
+  # counted childs were loaded (and counted) where their count meta was packed
+  asize, acount = (max(v, 0) if isinstance(v, int) else v for v in (attr.size, attr.count))
+  size, count = _childarg(asize, avail), _childarg(acount, avail)
+  code = [] if counted else _childlist(name)
+  if acount and not counted: code.append(f"  assert len(c_{name}) == {count}{'' if isinstance(acount, int) else f' or {count} <= 0'}, f\"invalid child count {{len(c_{name})}} != {{{count}}}\"")
+  if asize: code.append("  start = off")
+  # a list of fixed layout childs of a single type is encoded in one go by the child's generated loop (when every child really is of that type)
+  bulk = getattr(attr.childs[0], _ENCODE_MANY, None) if len(attr.childs) == 1 else None
+  # (childs are written in place, the buffer given to the top-level encode is sized by calcsize and already accounts for them)
+  loop = [f"  for val in c_{name}: off = val.{_ENCODE}(val, buf, off)"]
+  if bulk is not None: code += [f"  if all(type(val) is {_ref(ns, attr.childs[0])} for val in c_{name}): off = {_ref(ns, bulk)}(c_{name}, buf, off)", "  else:", *(f"  {line}" for line in loop)]
+  else: code += loop
+  if patch is not None: code.append(f"  {_ref(ns, Struct(patch[1].fmt).pack_into)}(buf, p_{patch[0]}, off - start)")
+  elif asize: code.append(f"  assert off - start == {size}{'' if isinstance(asize, int) else f' or {size} <= 0'}, f\"invalid child size {{off - start}} != {{{size}}}\"")
+  return code
+
+def _genencode(ptype: type, ns: dict[str, Any]) -> list[str]:
+  attrs, runs = getattr(ptype, _PATTRS), getattr(ptype, _PRUNS)
+  refs = {r for attr in attrs.values() for r in ([attr.size, attr.count] if isinstance(attr, Child) else _fmtrefs(attr.fmt))}
+  code, avail, patched, lens, counts = ["def _encode(obj, buf, off):"], [], _backpatched(attrs), _lenmetas(attrs), _countmetas(attrs)
+  sized = {field: meta for meta, field in lens.items()}
+  # meta fields whose value is the length of the attribute they describe
+  derived = {**{meta: [f"  v_{field} = {_encexpr(ns, field, attrs[field])}", f"  v_{meta} = len(v_{field})"] for meta, field in lens.items()},
+             **{meta: [*_childlist(child), f"  v_{meta} = len(c_{child})"] for meta, child in counts.items()}}
+  for fused, items in runs:
+    if fused is not None:
+      # derived metas are computed ahead of the run they are packed with
+      lines, args = _packargs(ns, items, refs, derived)
+      code += [*(line for name, _, _ in items for line in derived.get(name, [])), *(f"  {line}" for line in lines), f"  {_ref(ns, fused.pack_into)}(buf, off, {args})", f"  off += {fused.size}"]
+      avail += [name for name, _, _ in items]
+      continue
+    name, attr, _ = items[0]
+    if isinstance(attr, Child):
+      code += _genchildencode(ns, name, attr, avail, patched.get(name), counted=name in counts.values())
+      continue
+    if any(name == meta for meta, _ in patched.values()):
+      code += [f"  p_{name} = off", f"  off += {calcsize_fmt(attr.fmt)}"]
+      avail.append(name)
+      continue
+    if name in derived: code += derived[name]
+    elif name in sized:
+      # the bytes are exactly as long as the "{meta}s" format they are packed with
+      code += [f"  buf[off:off + v_{sized[name]}] = v_{name}", f"  off += v_{sized[name]}"]
+      avail.append(name)
+      continue
+    else: code.append(f"  v_{name} = {_encexpr(ns, name, attr, None if '{' in attr.fmt or getattr(attr, _STOP, None) is not None else _fmtvals(attr.fmt))}")
+    if "{" in attr.fmt:
+      code.append(f"  fmt = {_ref(ns, attr.fmt)}.format({_fmtargs(attr.fmt, avail)})")
+      pack, size = "pack_into(fmt, buf, off", "calcsize_fmt(fmt)"
+    else: pack, size = f"{_ref(ns, Struct(attr.fmt).pack_into)}(buf, off", str(calcsize_fmt(attr.fmt))
+    args = f"v_{name}" if "{" not in attr.fmt and _fmtvals(attr.fmt) == 1 else f"*valargs(v_{name})"
+    if getattr(attr, _STOP, None) is None: code += [f"  {pack}, {args})", f"  off += {size}"]
+    elif _fmtsplit(attr.fmt)[1] == "B" and _stopbyte(attr) is not None:
+      code += [f"  data = bytes([*totuple(v_{name}), {_ref(ns, attr.encode(attr.stop))}])", "  buf[off:off + len(data)] = data", "  off += len(data)"]
+    else: code += [f"  for v in [*totuple(v_{name}), {_ref(ns, attr.encode(attr.stop))}]:", f"    {pack}, v)", f"    off += {size}"]
+    avail.append(name)
+  return [*code, "  return off"]
+
+def _genchilddecode(ns: dict[str, Any], ptype: type, name: str, attr: Child, avail: list[str]) -> list[str]:
+  code: list[str] = []
+  asize, acount = (max(v, 0) if isinstance(v, int) else v for v in (attr.size, attr.count))
+  size, count = _childarg(asize, avail), _childarg(acount, avail)
+  # same loop condition as "bsize < size or size <= 0 and off < len(buf) and (count <= 0 or len(childs) < count)", folding the sides known at class creation
+  more = "off < len(buf)" + ("" if acount == 0 else f" and len(c_{name}) < {count}" if isinstance(acount, int) else f" and ({count} <= 0 or len(c_{name}) < {count})")
+  cond = f"bsize < {size}" if isinstance(asize, int) and asize > 0 else more if asize == 0 else f"bsize < {size} or {size} <= 0 and {more}"
+  bulk = getattr(attr.childs[0], _DECODE_MANY, None) if len(attr.childs) == 1 else None
+  table = _dispatch(attr.childs) if bulk is None else None
+  if bulk is not None:
+    # fixed layout childs of a single type: the amount of childs the loop would decode is known upfront
+    csize = getattr(attr.childs[0], _FIXED_SIZE)
+    left = f"(len(buf) - off) // {csize}"
+    if acount != 0: left = f"min({count}, {left})" if isinstance(acount, int) else f"{left} if {count} <= 0 else min({count}, {left})"
+    ncond = f"-(-{size} // {csize})" if isinstance(asize, int) and asize > 0 else left if asize == 0 else f"-(-{size} // {csize}) if {size} > 0 else {left}"
+    if asize == 0 and acount == 0: code.append(f"  assert (len(buf) - off) % {csize} == 0, f\"{{(len(buf) - off) % {csize}}} trailing bytes after {attr.childs[0].__name__} childs\"")
+    code.append(f"  c_{name}, off = {_ref(ns, bulk)}(buf, off, {ncond}, {_ref(ns, attr.childs[0])})")
+  elif table is not None:
+    # the prefix found at off tells which type to decode (at most one lookup per distinct prefix length matches)
+    ref = _ref(ns, table)
+    lookup = " or ".join(f"{ref}.get(bytes(buf[off:off + {n}]))" for n in sorted({len(prefix) for prefix in table}))
+    code += [f"  c_{name}, bsize = [], 0", f"  while {cond}:"]
+    if acount: code.append(f"    if len(c_{name}) >= {count}{' > 0' if isinstance(acount, str) else ''}: raise AssertionError(f\"invalid child size {{bsize}} != {{{size}}}\")")
+    code += [f"    subtype = {lookup}",
+             f"    if subtype is None: raise AssertionError(f\"no child type of {ptype.__name__}.{name} could be decoded at offset {{off}}\")",
+             f"    val, end = subtype.{_DECODE}(buf, off, subtype)",
+             "    bsize, off = bsize + end - off, end",
+             f"    c_{name}.append(val)"]
+  else:
+    code += [f"  c_{name}, bsize = [], 0", f"  while {cond}:", f"    for subtype in {_ref(ns, attr.childs)}:"]
+    # the count can only be reached here while bsize < size, the loop would never end otherwise (same as when no child type decodes)
+    if acount: code.append(f"      if len(c_{name}) >= {count}{' > 0' if isinstance(acount, str) else ''}: raise AssertionError(f\"invalid child size {{bsize}} != {{{size}}}\")")
+    code += ["      with suppress(Exception):",
+             f"        val, end = subtype.{_DECODE}(buf, off, subtype)",
+             "        bsize, off = bsize + end - off, end",
+             f"        c_{name}.append(val)",
+             "        break",
+             "    else:",
+             f"      raise AssertionError(f\"no child type of {ptype.__name__}.{name} could be decoded at offset {{off}}\")"]
+  if acount: code.append(f"  assert len(c_{name}) == {count}{'' if isinstance(acount, int) else f' or {count} <= 0'}, f\"invalid child count {{len(c_{name})}} != {{{count}}}\"")
+  code.append(f"  v_{name} = c_{name}[0] if len(c_{name}) == 1 else c_{name}")
+  return code
+
+def _genunpack(ns: dict[str, Any], ptype: type, span: list[tuple[Struct, tuple[tuple[str, Any, int], ...]]]) -> list[str]:
+  # consecutive runs only differing in byte order (explicit ones, with no alignment) are unpacked with a single Struct per byte order,
+  # each of them skipping the bytes of the other orders with pad bytes
+  orders = sorted({fused.format[0] for fused, _ in span})
+  if len(span) == 1 or not set(orders) <= {"<", ">"}:
+    return [line for fused, items in span for line in (*(f"  {line}" for line in _unpackto(ns, ptype, f"{_ref(ns, fused.unpack_from)}(buf, off)", items)), f"  off += {fused.size}")]
+  code: list[str] = []
+  for order in orders:
+    fused = Struct(order + "".join(run.format[1:] if run.format[0] == order else f"{run.size}x" for run, _ in span))
+    items = tuple(item for run, runitems in span if run.format[0] == order for item in runitems)
+    code += [f"  {line}" for line in _unpackto(ns, ptype, f"{_ref(ns, fused.unpack_from)}(buf, off)", items)]
+  return [*code, f"  off += {sum(run.size for run, _ in span)}"]
+
+def _gendecode(ptype: type, ns: dict[str, Any]) -> list[str]:
+  attrs, runs = getattr(ptype, _PATTRS), getattr(ptype, _PRUNS)
+  code, avail = ["def _decode(buf, off, cls=_cls):"], []
+  for i, (fused, items) in enumerate(runs):
+    if fused is not None:
+      # consecutive fused runs are unpacked together (the ones following the first of them are skipped)
+      if i > 0 and runs[i - 1][0] is not None: continue
+      span = list(takewhile(lambda run: run[0] is not None, runs[i:]))
+      code += _genunpack(ns, ptype, span)
+      avail += [name for _, items in span for name, _, _ in items]
+      continue
+    name, attr, _ = items[0]
+    if isinstance(attr, Child):
+      code += _genchilddecode(ns, ptype, name, attr, avail)
+      avail.append(name)
+      continue
+    ref = _bytesref(attrs, attr)
+    if ref in avail:
+      code += [f"  end = off + v_{ref}", "  assert off <= end <= len(buf), f\"buffer size too small ({len(buf)}/{end})\"",
+               f"  v_{name} = {_decexpr(ns, attr, 'bytes(buf[off:end])', 'bytes(buf[off:end])', 1)}", "  off = end"]
+      avail.append(name)
+      continue
+    if "{" in attr.fmt:
+      code.append(f"  fmt = {_ref(ns, attr.fmt)}.format({_fmtargs(attr.fmt, avail)})")
+      unpack, size, n = "unpack_from(fmt, buf, off)", "calcsize_fmt(fmt)", None
+    else: unpack, size, n = f"{_ref(ns, Struct(attr.fmt).unpack_from)}(buf, off)", str(calcsize_fmt(attr.fmt)), _fmtvals(attr.fmt)
+    expr = _decexpr(ns, attr, unpack, f"{unpack}[0]", n)
+    stop = _stopbyte(attr) if isinstance(attr, Field) and attr.stop is not None else None
+    if getattr(attr, _STOP, None) is None: code += [f"  v_{name} = {expr}", f"  off += {size}"]
+    elif stop is not None:
+      # the values are the ones before the first stop byte (found by bytes.find), "B" values being the bytes themselves
+      code += [f"  end = buf.find({_ref(ns, stop)}, off)", f"  assert end >= 0, f\"no stop value found for {ptype.__name__}.{name} after offset {{off}}\""]
+      if _fmtsplit(attr.fmt)[1] != "B": values = f"[{_decexpr(ns, attr, 't', 't[0]', 1)} for t in {_ref(ns, Struct(attr.fmt).iter_unpack)}(buf[off:end])]"
+      else: values = "list(buf[off:end])" if attr.dec is None else f"[{_decexpr(ns, attr, '(x,)', 'x', 1)} for x in buf[off:end]]"
+      code.append(f"  v_{name} = {values}")
+      code.append("  off = end + 1")
+    else: code += [f"  v_{name} = []", "  while True:", f"    v = {expr}", f"    off += {size}", f"    if v == {_ref(ns, attr.stop)}: break", f"    v_{name}.append(v)"]
+    code += [f"  {line}" for line in _constcheck(ns, ptype, name, attr)]
+    avail.append(name)
+  return [*code, f"  return cls({_ctorargs(attrs)}), off"]
+
+def _sizeref(ns: dict[str, Any], attrs: dict[str, Any], lens: dict[str, str], name: str, n: int | None) -> list[str]:
+  # computes the value of an attribute the size depends on (the one of a length meta being the length of its Field's encoded bytes)
+  if name in lens: return [f"  v_{lens[name]} = {_encexpr(ns, lens[name], attrs[lens[name]])}", f"  v_{name} = len(v_{lens[name]})"]
+  return [f"  v_{name} = {_encexpr(ns, name, attrs[name], n)}"]
+
+def _gencalcsize(ptype: type, ns: dict[str, Any]) -> list[str]:
+  attrs, runs = getattr(ptype, _PATTRS), getattr(ptype, _PRUNS)
+  refs = {r for attr in attrs.values() if not isinstance(attr, Child) for r in _fmtrefs(attr.fmt)}
+  lens = _lenmetas(attrs)
+  code: list[str] = []
+  avail: list[str] = []
+  fixed = 0
+  for fused, items in runs:
+    if fused is not None:
+      code += [line for name, _, n in items if name in refs for line in _sizeref(ns, attrs, lens, name, n)]
+      fixed, avail = fixed + fused.size, [*avail, *(name for name, _, _ in items)]
+      continue
+    name, attr, _ = items[0]
     if isinstance(attr, Child):
-      size += sum(calcsize(val) for val in attr.attrs(name, vals, obj)[0])
-    else:
-      vals[name] = attr.encode(attr.value if isinstance(attr, Const) else getattr(obj, name))
-      mult = 1 if getattr(attr, _STOP, None) is None else len(totuple(vals[name])) + 1
-      size += calcsize_fmt(attr.fmt.format(**vals)) * mult
-  return size
+      code += _childlist(name)
+      # childs of a single fixed size type add up to their count times that size
+      csize = getattr(attr.childs[0], _FIXED_SIZE, None) if len(attr.childs) == 1 else None
+      total = f"sum(val.{_CALCSIZE}(val) for val in c_{name})"
+      code.append(f"  size += {total}" if csize is None else f"  size += len(c_{name}) * {csize} if all(type(val) is {_ref(ns, attr.childs[0])} for val in c_{name}) else {total}")
+      continue
+    stop = getattr(attr, _STOP, None) is not None
+    if name in refs or stop: code += _sizeref(ns, attrs, lens, name, None if "{" in attr.fmt or stop else _fmtvals(attr.fmt))
+    size = f"calcsize_fmt({_ref(ns, attr.fmt)}.format({_fmtargs(attr.fmt, avail)}))" if "{" in attr.fmt else str(calcsize_fmt(attr.fmt))
+    if name in lens.values(): size = f"v_{_fmtrefs(attr.fmt)[0]}"
+    if "{" not in attr.fmt and not stop: fixed += calcsize_fmt(attr.fmt)
+    else: code.append(f"  size += {size}" + (f" * (len(totuple(v_{name})) + 1)" if stop else ""))
+    avail.append(name)
+  return ["def _calcsize(obj):", f"  size = {fixed}", *code, "  return size"]
+
+def _positional(ptype: type, names: list[str]) -> bool:
+  # whether ptype(*values) binds the values to the given names the same way ptype(**values) does
+  with suppress(TypeError, ValueError):
+    params = list(signature(ptype).parameters.values())[:len(names)]
+    return [p.name for p in params] == names and all(p.kind is Parameter.POSITIONAL_OR_KEYWORD for p in params)
+  return False
+
+def _compile(ptype: type) -> type:
+  ns: dict[str, Any] = {"_cls": ptype, "calcsize_fmt": calcsize_fmt, "pack_into": pack_into, "unpack_from": unpack_from,
+                        "suppress": suppress, "starmap": starmap, "totuple": totuple, "expifsingle": expifsingle, "valargs": valargs}
+  src = [*_genencode(ptype, ns), *_gendecode(ptype, ns), *_gencalcsize(ptype, ns)]
+  runs = getattr(ptype, _PRUNS)
+  if len(runs) == 1 and runs[0][0] is not None:
+    # classes made of a single fused struct are packed with a single call straight into a new bytes object when no buffer is given,
+    # and get a loop encoding/decoding many objects back to back (used for childs and by encode_many)
+    fused, items = runs[0]
+    lines, args = _packargs(ns, items, set())
+    src += ["def _pack(obj):", *(f"  {line}" for line in lines), f"  return {_ref(ns, fused.pack)}({args})",
+            "def _encode_many(objs, buf, off):", "  for obj in objs:", *(f"    {line}" for line in lines), f"    {_ref(ns, fused.pack_into)}(buf, off, {args})", f"    off += {fused.size}", "  return off",
+            "def _decode_many(buf, off, n, cls=_cls):", f"  end = off + n * {fused.size}", "  assert end <= len(buf), f\"buffer size too small ({len(buf)}/{end})\""]
+    # records whose unpacked values are exactly their constructor's arguments are built straight from them (subclasses may take other arguments)
+    if all(isinstance(attr, Field) and not attr.meta and attr.dec is None and n == 1 for _, attr, n in items) and _positional(ptype, [name for name, _, _ in items]):
+      src.append(f"  if cls is _cls: return list(starmap(cls, {_ref(ns, fused.iter_unpack)}(memoryview(buf)[off:end]))), end")
+    src += ["  objs = []", f"  for t in {_ref(ns, fused.iter_unpack)}(memoryview(buf)[off:end]):", *(f"    {line}" for line in _unpackto(ns, ptype, "t", items)),
+            f"    objs.append(cls({_ctorargs(getattr(ptype, _PATTRS))}))", "  return objs, end"]
+  exec(compile("\n".join(src), f"<obj2bin {ptype.__qualname__}>", "exec"), ns) # noqa: S102
+  # the size of classes made only of fixed size attributes is known upfront (None otherwise, so a subclass does not inherit its parent's)
+  setattr(ptype, _FIXED_SIZE, sum(fused.size for fused, _ in runs) if all(fused is not None for fused, _ in runs) else None)
+  for name in (_ENCODE, _DECODE, _CALCSIZE, _PACK, _ENCODE_MANY, _DECODE_MANY):
+    if name in ns: setattr(ptype, name, staticmethod(ns[name]))
+  return ptype
+
+def pack(**attrs: Const | Field | Child) -> Callable[[type], type]: return lambda x: setattr(x, _PATTRS, attrs) or setattr(x, _PRUNS, _fuse(attrs)) or _compile(dataclass(x)) # type: ignore[func-returns-value]
+def calcsize(obj: object) -> int:
+  fixed = getattr(obj, _FIXED_SIZE, None)
+  return fixed if fixed is not None else getattr(obj, _CALCSIZE)(obj)
 
 def encode(obj: object, buffer: bytearray | None = None, offset: int = 0) -> tuple[bytes, int]:
-  vals: dict[str, Any] = {}
+  fixed = getattr(obj, _PACK, None)
+  if fixed is not None and not isinstance(buffer, (bytearray, bytes)):
+    packed = fixed(obj)
+    return packed, len(packed)
   bsize = calcsize(obj)
   if not isinstance(buffer, (bytearray, bytes)): buffer = bytearray(bsize)
   assert offset + bsize <= len(buffer), f"buffer size too small ({len(buffer)}/{offset + bsize})"
-  for name, attr in getattr(obj, _PATTRS).items():
-    if isinstance(attr, Child):
-      childs, size, count, cstart = *attr.attrs(name, vals, obj), offset
-      assert len(childs) == count or count <= 0, f"invalid child count {len(childs)} != {count}"
-      for val in childs:
-        b, s = encode(val)
-        buffer[offset:offset+s], offset = b, offset + s
-      assert offset - cstart == size or size <= 0, f"invalid child size {offset - cstart} != {size}"
-    else:
-      val, fmt = attr.encode(attr.value if isinstance(attr, Const) else getattr(obj, name)), attr.fmt.format(**vals)
-      vals[name], size, stop = val, calcsize_fmt(fmt), getattr(attr, _STOP, None)
-      if stop is None:
-        if not isinstance(val, (list, tuple)): val = (val,) # not calling totuple as val might be an iterable object other that list or tuple (e.g. str)
-        pack_into(fmt, buffer, offset, *val)
-        offset += size
-      else:
-        for v in [*totuple(val), attr.encode(stop)]:
-          pack_into(fmt, buffer, offset, v)
-          offset += size
+  getattr(obj, _ENCODE)(obj, buffer, offset)
   return bytes(buffer), bsize
 
-def decode(ptype: _T, buffer: bytes | bytearray, offset: int = 0) -> tuple[_T, int]: # noqa: C901
-  vals: dict[str, Any] = {}
-  start = offset
+def encode_many(objs: list | tuple, buffer: bytearray | None = None, offset: int = 0) -> tuple[bytes, int]:
+  # objects of the same fixed layout type are encoded by a single generated loop, any other sequence is encoded object by object
+  bulk = getattr(objs[0], _ENCODE_MANY, None) if objs else None
+  if bulk is not None and any(type(obj) is not type(objs[0]) for obj in objs): bulk = None
+  bsize = len(objs) * calcsize(objs[0]) if bulk is not None else sum(calcsize(obj) for obj in objs)
+  if not isinstance(buffer, (bytearray, bytes)): buffer = bytearray(bsize)
+  assert offset + bsize <= len(buffer), f"buffer size too small ({len(buffer)}/{offset + bsize})"
+  if bulk is not None: bulk(objs, buffer, offset)
+  else:
+    for obj in objs: offset = getattr(obj, _ENCODE)(obj, buffer, offset)
+  return bytes(buffer), bsize
+
+def decode(ptype: _T, buffer: bytes | bytearray, offset: int = 0) -> tuple[_T, int]:
   assert isinstance(ptype, type), f"\"{type(ptype).__name__}\" is not a type"
-  for name, attr in getattr(ptype, _PATTRS).items():
-    if isinstance(attr, Child):
-      vals[name], size, count, bsize = *attr.attrs(name, vals), 0
-      while bsize < size or size <= 0 and (offset < len(buffer) and count <= 0 or offset < len(buffer) and len(vals[name]) < count):
-        for subtype in attr.childs:
-          if len(vals[name]) >= count > 0: break
-          with suppress(Exception):
-            obj, s = decode(subtype, buffer, offset)
-            bsize, offset = bsize + s, offset + s
-            vals[name].append(obj)
-            break
-      assert len(vals[name]) == count or count <= 0, f"invalid child count {len(vals[name])} != {count}"
-      if len(vals[name]) == 1: vals[name] = vals[name][0]
-    else:
-      fmt, stop = attr.fmt.format(**vals), getattr(attr, _STOP, None)
-      if stop is None:
-        vals[name], offset = attr.decode(unpack_from(fmt, buffer, offset)), offset + calcsize_fmt(fmt)
-      else:
-        vals[name] = []
-        while True:
-          v, offset = attr.decode(unpack_from(fmt, buffer, offset)), offset + calcsize_fmt(fmt)
-          if v == stop: break
-          vals[name].append(v)
-      assert (isinstance(attr, Const) and attr.value == vals[name]) or not isinstance(attr, Const), f"unexpected value found for {ptype.__name__}.{name}: {vals[name]} (expected: {attr.value})"
-  for name, attr in getattr(ptype, _PATTRS).items():
-    if isinstance(attr, Field) and attr.meta or isinstance(attr, Const): vals.pop(name)
-  return ptype(**vals), offset - start
+  obj, end = getattr(ptype, _DECODE)(buffer, offset, ptype)
+  return obj, end - offset
+
+def decode_many(ptype: type[_T], buffer: bytes | bytearray, count: int = 0, offset: int = 0) -> tuple[list[_T], int]:
+  # decodes count objects of ptype back to back (as many as the buffer holds if count <= 0), fixed layout types by a single generated loop
+  bulk = getattr(ptype, _DECODE_MANY, None)
+  if bulk is not None:
+    fixed = getattr(ptype, _FIXED_SIZE)
+    if count <= 0: assert (len(buffer) - offset) % fixed == 0, f"{(len(buffer) - offset) % fixed} trailing bytes after {ptype.__name__} objects"
+    objs, end = bulk(buffer, offset, count if count > 0 else (len(buffer) - offset) // fixed, ptype)
+    return objs, end - offset
+  objs, end = [], offset
+  while len(objs) < count if count > 0 else end < len(buffer):
+    obj, end = getattr(ptype, _DECODE)(buffer, end, ptype)
+    objs.append(obj)
+  return objs, end - offset
@@ -3,8 +3,10 @@
 from __future__ import annotations
 
 import unittest
+from typing import Callable
 
-from obj2bin import Const, Field, Child, pack, calcsize, encode, decode, utf8size, utf8tobytes, utf8frombytes
+from obj2bin import Const, Field, Child, pack, calcsize, encode, encode_many, decode, decode_many, utf8size, utf8tobytes, utf8frombytes
+from obj2bin.obj2bin import _inline, _dispatch, _positional
 
 @pack(_id=Const(0, "B"), value=Field("i"))
 class DummyInt:
@@ -79,6 +81,58 @@ class DummyEncDec:
 class DummyFieldMeta:
   value: int = 0
 
+@pack(a=Field("B"), b=Field("H"), c=Field("@BH"), d=Field("<H"), e=Field("<2b"))
+class DummyNative:
+  a: int
+  b: int
+  c: tuple
+  d: int
+  e: tuple
+
+@pack(size=Field("B", meta=True), values=Field("<{size}H"), text=Field("B", stop=0))
+class DummyVariable:
+  values: tuple[int, ...]
+  text: list[int]
+  @property
+  def size(self) -> int: return len(self.values)
+
+@pack(network=Field("!H"), big=Field(">H"), const=Const(0x0b0c, ">H"))
+class DummyNetwork:
+  network: int
+  big: int
+
+@pack(size=Field("B", meta=True), name=Field("{size}s", enc=utf8tobytes, dec=utf8frombytes))
+class DummyName:
+  name: str
+  @property
+  def size(self) -> int: return utf8size(self.name)
+
+@pack(age=Field("<B"), height=Field("<f"), size=Field("<B", meta=True), name=Field("<{size}s", enc=utf8tobytes, dec=utf8frombytes))
+class DummyPerson:
+  age: int
+  height: float
+  name: str
+  @property
+  def size(self) -> int: return utf8size(self.name)
+
+@pack(childs=Child(DummyNetwork))
+class DummyNetworkList:
+  childs: list
+
+@pack(x=Field("<h"), y=Field("<h"))
+class DummyPoint:
+  x: int
+  y: int
+
+@pack(points=Child(DummyPoint))
+class DummyPointList:
+  points: list
+
+def _fails(fn: Callable[[], object]) -> bool:
+  try: fn()
+  except AssertionError: return True
+  return False
+
 class TestPack(unittest.TestCase):
   # def test_dummy_count_size(self) -> None:
   #   # TODO: rethink test
@@ -94,11 +148,45 @@ class TestPack(unittest.TestCase):
   #   # child size
   #   # dummy = DummyChildSize([], [])
 
+  def test_child_size(self) -> None:
+    # a meta field only giving the size of a Child is written from the bytes its childs took (the size_str property is not used)
+    dummy = DummyChildSize([DummyInt(0), DummyInt(1)], [DummyInt(2), DummyFloat(3.0)])
+    buff, size = encode(dummy)
+    assert size == calcsize(dummy) == 10 + 1 + 10 and buff[10] == 10
+    assert decode(DummyChildSize, buff) == (dummy, size)
+
+  def test_child_count(self) -> None:
+    # a meta field only giving the count of a Child is written from the length of its list
+    dummy = DummyChildCount([DummyInt(0), DummyFloat(0.0), DummyByteOrder(0, 0)], [DummyInt(1), DummyInt(2)])
+    buff, size = encode(dummy)
+    assert size == calcsize(dummy) == 18 + 1 + 10 and buff[18] == 2
+    assert decode(DummyChildCount, buff) == (dummy, size)
+
+  def test_length_meta(self) -> None:
+    # the length of a "{meta}s" field is taken from its encoded bytes (utf8size counts characters, not bytes)
+    dummy = DummyName("h\u00e9llo")
+    buff, size = encode(dummy)
+    assert buff == b"\x06h\xc3\xa9llo" and size == calcsize(dummy) == 7
+    assert decode(DummyName, buff) == (dummy, size)
+    assert _fails(lambda: decode(DummyName, buff[:-1])), "decoding must fail when the bytes go past the buffer"
+
+  def test_meta_fused(self) -> None:
+    # meta fields are packed and unpacked along with the fixed fields around them
+    dummy = DummyPerson(22, 180.5, "Fogell")
+    buff, size = encode(dummy)
+    assert buff == b"\x16\x00\x80\x34\x43\x06Fogell" and size == calcsize(dummy) == 12
+    assert decode(DummyPerson, buff) == (dummy, size)
+    fused, items = vars(DummyPerson)["_pruns"][0]
+    assert fused is not None and fused.format == "<BfB" and [name for name, _, _ in items] == ["age", "height", "size"]
+
   def test_calcsize(self) -> None:
     assert calcsize(DummyInt(0)) == 5
     assert calcsize(DummyFloat(0.0)) == 5
     assert calcsize(DummyByteOrder(0, 0)) == 8
     assert calcsize(DummyChild([DummyInt(0), DummyFloat(0.0), DummyByteOrder(0, 0)])) == 18
+    # fixed size classes know their size upfront (even when made of structs with different byte orders)
+    assert vars(DummyByteOrder)["_fixed_size"] == 8 and vars(DummyVariable)["_fixed_size"] is None
+    assert calcsize(DummyNetworkList([DummyNetwork(0, 0)] * 3)) == 18
 
   def test_buffer_and_offset(self) -> None:
     dummy = DummyByteOrder(0, 0)
@@ -113,6 +201,12 @@ class TestPack(unittest.TestCase):
     d2, size = decode(DummyByteOrder, buffer, size)
     assert d1 == d2 == dummy
 
+  def test_child_in_place(self) -> None:
+    # childs are encoded in place within the parent's buffer
+    parent = DummyChild([DummyInt(1), DummyFloat(2.0), DummyByteOrder(3, 4)])
+    buff, size = encode(parent, bytearray(3 + calcsize(parent)), 3)
+    assert buff[3:] == encode(parent)[0] and decode(DummyChild, buff, 3) == (parent, size)
+
   def test_order(self) -> None:
     buff, _ = encode(DummyByteOrder(0x1337, 0x1337))
     assert buff[0] == 0x13 and buff[1] == 0x37, "incorrect Const big-endian order"
@@ -121,9 +215,82 @@ class TestPack(unittest.TestCase):
     assert buff[6] == 0x37 and buff[7] == 0x13, "incorrect Field little-endian order"
     for name, val in vars(decode(DummyByteOrder, buff)[0]).items(): assert val == 0x1337, f"incorrect decoded value for Field \"{name}\""
 
+  def test_fused_layout(self) -> None:
+    # fusing fields into a single struct must not add the padding native alignment would (each field is packed on its own)
+    dummy = DummyNative(1, 0x0203, (4, 0x0506), 0x0708, (-1, 2))
+    buff, size = encode(dummy)
+    assert size == calcsize(dummy) == 1 + 2 + 4 + 2 + 2
+    assert buff[0] == 1 and buff[-4:] == bytes((0x08, 0x07, 0xff, 0x02))
+    assert decode(DummyNative, buff)[0] == dummy
+
+  def test_variable(self) -> None:
+    dummy = DummyVariable((1, 2, 3), [4, 5])
+    buff, size = encode(dummy)
+    assert size == calcsize(dummy) == 1 + 3 * 2 + 3
+    assert buff == bytes((3, 1, 0, 2, 0, 3, 0, 4, 5, 0))
+    assert decode(DummyVariable, buff) == (dummy, size)
+    assert _fails(lambda: decode(DummyVariable, buff[:-1])), "decoding must fail when there is no stop value"
+
+  def test_fixed(self) -> None:
+    # network and big-endian orders fuse into a single struct on any host
+    assert hasattr(DummyNetwork, "_pack"), "DummyNetwork did not compile to a single struct"
+    dummy = DummyNetwork(0x0102, 0x0304)
+    buff, size = encode(dummy)
+    assert buff == bytes((1, 2, 3, 4, 0xb, 0xc)) and size == calcsize(dummy) == 6
+    assert encode(dummy, bytearray(size)) == (buff, size), "fixed size fast path differs from buffer encoding"
+    assert decode(DummyNetwork, buff) == (dummy, size)
+
+  def test_many(self) -> None:
+    dummies = [DummyNetwork(i, i + 1) for i in range(4)]
+    buff, size = encode_many(dummies)
+    assert size == 4 * calcsize(dummies[0]) and buff == b"".join(encode(dummy)[0] for dummy in dummies)
+    assert encode(DummyNetworkList(dummies)) == (buff, size)
+    assert decode(DummyNetworkList, buff)[0].childs == dummies
+    assert decode_many(DummyNetwork, buff) == (dummies, size) and decode_many(DummyNetwork, buff + b"\x00", 2, 6) == (dummies[1:3], 12)
+    mixed = [DummyInt(1), DummyFloat(2.0), DummyByteOrder(3, 4)]
+    buff, size = encode_many(mixed)
+    assert size == sum(map(calcsize, mixed)) and decode(DummyChild, buff)[0].childs == mixed
+    names = [DummyName("a"), DummyName("bc")]
+    buff, size = encode_many(names)
+    assert decode_many(DummyName, buff) == (names, size) and decode_many(DummyName, buff, 1) == (names[:1], 2)
+    assert _fails(lambda: decode(DummyChild, buff + b"\x09")), "decoding must fail when no child type matches"
+
+  def test_dispatch(self) -> None:
+    assert _dispatch((DummyInt, DummyFloat, DummyByteOrder)) == {b"\x00": DummyInt, b"\x01": DummyFloat, b"\x13\x37\x37\x13": DummyByteOrder}
+    assert _dispatch((DummyInt, DummyNetwork)) is None, "types without a Const prefix are tried in turn"
+    assert _dispatch((DummyInt, DummyString, DummyInt)) is None, "ambiguous prefixes keep trying the types in their declared order"
+    buff = encode(DummyInt(1))[0] + encode(DummyByteOrder(2, 3))[0] + encode(DummyFloat(4.0))[0]
+    assert decode(DummyChild, buff)[0].childs == [DummyInt(1), DummyByteOrder(2, 3), DummyFloat(4.0)]
+
+  def test_many_positional(self) -> None:
+    # plain records are built straight from their unpacked values, unless the constructor does not take them in packing order
+    points = [DummyPoint(i, -i) for i in range(5)]
+    assert decode(DummyPointList, encode(DummyPointList(points))[0])[0].points == points
+    assert _positional(DummyPoint, ["x", "y"]) and not _positional(DummyPoint, ["y", "x"]) and not _positional(DummyName, ["size", "name"])
+
+  def test_inline(self) -> None:
+    scale = 100
+    assert _inline(lambda x: int(x * 100), "obj.x") == "(int(obj.x * 100))"
+    assert _inline(lambda x: float(x / 100), "t[0]") == "(float(t[0] / 100))"
+    assert _inline(lambda x: float(x / 100), "t[0]", "H") == "(t[0] / 100)", "float() of a division between numbers is redundant"
+    assert _inline(lambda x: int(x) + 1, "t[0]", "B") == "(t[0] + 1)" and _inline(lambda x: int(x) + 1, "t[0]", "f") == "(int(t[0]) + 1)"
+    assert _inline(lambda x: int(x * scale), "obj.x") is None, "closures must not be inlined"
+    assert _inline(lambda x: _strtotuple(x), "obj.x") is None, "only builtins may be referenced" # noqa: PLW0108 (the lambda wrapper is what is being tested)
+    assert _inline(lambda x: x * globals()["SCALE"], "obj.x") is None, "scope dependent builtins must not be inlined"
+    assert _inline(lambda x: (x,), "obj.x") is None, "tuple/list results are unwrapped by process"
+    assert _inline(lambda x: x * x, "obj.x") is None, "the parameter must be evaluated once"
+    assert _inline(_strtotuple, "obj.x") is None
+
+  def test_subclass_and_unwrap(self) -> None:
+    class DummySub(DummyInt): pass
+    obj: object = decode(DummySub, encode(DummyInt(5))[0])[0]
+    assert isinstance(obj, DummySub) and obj.value == 5
+    assert encode(DummyInt([5]))[0] == encode(DummyInt(5))[0], "single-element sequences pack as their element"
+
   def test_enc_dec(self) -> None:
     dummy = DummyEncDec((8, 7, 6, 5, 4, 3, 2, 1))
     buff, _ = encode(dummy)
+    assert _fails(lambda: decode(DummyEncDec, b"\x09" + buff[1:])), "decoded Const values must still be checked"
     obj, _ = decode(DummyEncDec, buff)
     assert obj == dummy
 